@@ -1,33 +1,294 @@
 
+import hashlib
 import json
+import os
 from pathlib import Path
+import sys
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
+import torch
+from tqdm.auto import tqdm
+
+# The encoder helpers (precision reduction, the int8 ONNX encoder) are shared with the
+# ChromaDB pipeline and live in the top-level embedding_utils
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from embedding_utils import OnnxEncoder, encoder_key, load_model, resolve_backend
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+def encode_bucketed(model, texts, batch_size=64, bucket_width=16):
+    """Encode texts in batches of similar token length, so each batch pads as little as possible."""
+    tokenizer = model.tokenizer
+    encoded = tokenizer(texts, padding=False, truncation=True, max_length=model.max_seq_length)
+    lengths = [len(ids) for ids in encoded["input_ids"]]
+    order = sorted(range(len(texts)), key=lengths.__getitem__)
+    out = None
+    with torch.inference_mode():
+        start = 0
+        while start < len(order):
+            bucket = lengths[order[start]] // bucket_width
+            end = start + 1
+            while end < len(order) and end - start < batch_size and lengths[order[end]] // bucket_width == bucket:
+                end += 1
+            idx = order[start:end]
+            features = tokenizer.pad({k: [v[i] for i in idx] for k, v in encoded.items()}, return_tensors="pt")
+            features = {k: t.to(model.device) for k, t in features.items()}
+            # Runs the model's own pooling modules; normalize on-device before the copy out (FAISS expects float32)
+            emb = model(features)["sentence_embedding"].float()
+            emb = torch.nn.functional.normalize(emb, p=2, dim=1).cpu().numpy()
+            if out is None:
+                out = np.empty((len(texts), emb.shape[1]), dtype=np.float32)
+            out[idx] = emb
+            start = end
+    return out
+
+
+class EmbeddingCache:
+    """Append-only on-disk embedding cache keyed by sha1 of (model key, text)."""
+
+    def __init__(self, path, model_key):
+        # One pair of files per encoder, so models with different dimensions never share a store
+        path = Path(path)
+        path = path.with_name(f"{path.name}-{hashlib.sha1(model_key.encode('utf-8')).hexdigest()[:12]}")
+        self.vectors_path = path.with_suffix(".f32")
+        self.keys_path = path.with_suffix(".keys")
+        self.model_key = model_key
+        self.dim = None
+        self.rows = {}
+        self.count = 0
+        self.used = set()
+        self._vectors = None
+        if self.keys_path.exists():
+            with open(self.keys_path) as f:
+                lines = f.read().split()
+            if lines:
+                self.dim = int(lines[0])
+                self.rows = {key: i for i, key in enumerate(lines[1:])}
+                self.count = len(lines) - 1
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.model_key}\0{text}".encode("utf-8")).hexdigest()
+
+    def encode(self, texts, encode_fn):
+        """Return float32 embeddings for texts, calling encode_fn only on cache misses."""
+        keys = [self.key(t) for t in texts]
+        self.used.update(keys)
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in self.rows and key not in missing:
+                missing[key] = i
+        if missing:
+            self._append(list(missing), encode_fn([texts[i] for i in missing.values()]))
+        if self._vectors is None:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        return np.ascontiguousarray(self._vectors[[self.rows[k] for k in keys]])
+
+    def _append(self, keys, embeddings):
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            with open(self.keys_path, "w") as f:
+                f.write(f"{self.dim}\n")
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding cache {self.keys_path} holds {self.dim}-dim vectors, "
+                             f"got {embeddings.shape[1]}-dim ones; delete it to rebuild")
+        with open(self.vectors_path, "ab") as f:
+            # Drop rows left behind by an interrupted run that never recorded their keys
+            f.truncate(self.count * self.dim * 4)
+            f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        with open(self.keys_path, "a") as f:
+            f.write("".join(f"{key}\n" for key in keys))
+        for key in keys:
+            self.rows[key] = self.count
+            self.count += 1
+        self._vectors = None
+
+    def compact(self, block_rows=4096):
+        """Rewrite the cache with only the rows used since it was opened, if most are stale."""
+        live = [key for key in self.rows if key in self.used]
+        if self.count - len(live) <= len(live):
+            return
+        old_rows = np.fromiter((self.rows[key] for key in live), dtype=np.int64, count=len(live))
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        tmp_vectors = self.vectors_path.with_name(self.vectors_path.name + ".tmp")
+        tmp_keys = self.keys_path.with_name(self.keys_path.name + ".tmp")
+        with open(tmp_vectors, "wb") as f:
+            for i in range(0, len(old_rows), block_rows):
+                f.write(np.ascontiguousarray(vectors[old_rows[i:i + block_rows]]).tobytes())
+        del vectors
+        with open(tmp_keys, "w") as f:
+            f.write(f"{self.dim}\n")
+            f.write("".join(f"{key}\n" for key in live))
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_keys, self.keys_path)
+        print(f"Compacted embedding cache from {self.count} to {len(live)} rows")
+        self.rows = {key: i for i, key in enumerate(live)}
+        self.count = len(live)
+        self._vectors = None
+
 
 class ComponentIndexer:
     PROJECT_ROOT = Path(__file__).parent
     BUILD_INDEX_PATH = PROJECT_ROOT / "build-index"
-    CHUNKS_FILE = BUILD_INDEX_PATH / "component_chunks.json"
+    CHUNKS_FILE = BUILD_INDEX_PATH / "component_chunks.ndjson"
     INDEX_FILE = BUILD_INDEX_PATH / "components.faiss"
-    META_FILE = BUILD_INDEX_PATH / "chunks_meta.json"
+    FLAT_VECTORS_FILE = INDEX_FILE.with_suffix(".npy")
+    META_FILE = BUILD_INDEX_PATH / "chunks_meta.ndjson"
+    OFFSETS_FILE = BUILD_INDEX_PATH / "chunks_offsets.i64"
+    ENCODER_FILE = BUILD_INDEX_PATH / "encoder.json"
+    ONNX_CACHE_PATH = BUILD_INDEX_PATH / "onnx"
+    EMBEDDING_CACHE = BUILD_INDEX_PATH / "emb_cache"
+    INDEX_TYPES = ("flat", "hnsw", "hnsw_sq8", "ivfpq")
+
+    @staticmethod
+    def encoder_key(model_name="all-MiniLM-L6-v2", backend="torch"):
+        """Describes the vectors the resolved encoder produces; used to key the embedding cache."""
+        return encoder_key(model_name, backend)
+
+    @staticmethod
+    def load_model(model_name="all-MiniLM-L6-v2", backend="torch"):
+        """Load the encoder; backend="onnx" uses ONNX Runtime when optimum is installed."""
+        return load_model(model_name, backend, ComponentIndexer.ONNX_CACHE_PATH)
+
+    @staticmethod
+    def create_index(d, n, index_type="hnsw"):
+        """Create an inner-product index; vectors are L2-normalized so IP == cosine."""
+        if index_type == "ivfpq":
+            # PQ needs >= 256 training points per sub-quantizer; IVF wants ~39 points per list
+            if n >= 256:
+                nlist = min(1024, max(1, n // 39))
+                return faiss.index_factory(d, f"IVF{nlist},PQ32", faiss.METRIC_INNER_PRODUCT)
+            print(f"Only {n} vectors, too few to train IVF-PQ; using HNSW instead")
+            index_type = "hnsw"
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(d, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            return index
+        if index_type == "hnsw_sq8":
+            # HNSW graph over int8 scalar-quantized vectors: a quarter of the bytes per distance
+            index = faiss.IndexHNSWSQ(d, faiss.ScalarQuantizer.QT_8bit, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            return index
+        if index_type == "flat":
+            return faiss.IndexFlatIP(d)
+        raise ValueError(f"Unknown index_type '{index_type}', expected one of {ComponentIndexer.INDEX_TYPES}")
+
+    @staticmethod
+    def iter_chunk_windows(window_size):
+        """Yield (texts, raw JSON lines) from the NDJSON chunks file, window_size rows at a time."""
+        texts, rows = [], []
+        with open(ComponentIndexer.CHUNKS_FILE, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                texts.append(json_loads(line)["text"])
+                rows.append(line)
+                if len(rows) == window_size:
+                    yield texts, rows
+                    texts, rows = [], []
+        if rows:
+            yield texts, rows
 
     @staticmethod
-    def build_index(model_name="all-MiniLM-L6-v2", batch_size=64):
-        with open(ComponentIndexer.CHUNKS_FILE, 'r') as f:
-            chunks = json.load(f)
-        texts = [c["text"] for c in chunks]
-        model = SentenceTransformer(model_name)
-        print("Encoding", len(texts), "texts...")
-        embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True, batch_size=batch_size)
-        faiss.normalize_L2(embeddings)
-        d = embeddings.shape[1]
-        index = faiss.IndexFlatIP(d)
-        index.add(embeddings)
-        faiss.write_index(index, str(ComponentIndexer.INDEX_FILE))
-        with open(ComponentIndexer.META_FILE, 'w') as f:
-            json.dump(chunks, f, indent=2)
-        print("Saved FAISS index to", ComponentIndexer.INDEX_FILE, "and metadata to", ComponentIndexer.META_FILE)
+    def count_chunks():
+        with open(ComponentIndexer.CHUNKS_FILE, 'rb') as f:
+            return sum(1 for line in f if line.strip())
+
+    @staticmethod
+    def encode(model, texts, batch_size=64):
+        """Encode texts to L2-normalized float32 embeddings, so inner product == cosine."""
+        if isinstance(model, OnnxEncoder):
+            # Encode in length-sorted order so each batch pads to similar lengths, then restore order
+            order = np.argsort([len(t) for t in texts], kind="stable")
+            embeddings = model.encode([texts[i] for i in order], batch_size=batch_size, normalize_embeddings=True)
+            return embeddings[np.argsort(order)]
+        return encode_bucketed(model, texts, batch_size)
+
+    @staticmethod
+    def build_index(model_name="all-MiniLM-L6-v2", batch_size=64, backend="torch", index_type="hnsw", window_batches=16):
+        """Encode chunks window by window into the index, writing metadata and offsets alongside it."""
+        if index_type not in ComponentIndexer.INDEX_TYPES:
+            raise ValueError(f"Unknown index_type '{index_type}', expected one of {ComponentIndexer.INDEX_TYPES}")
+        model = None
+        backend = resolve_backend(backend)
+
+        def encode_misses(texts):
+            nonlocal model
+            if model is None:
+                model = ComponentIndexer.load_model(model_name, backend)
+            return ComponentIndexer.encode(model, texts, batch_size)
+
+        key = ComponentIndexer.encoder_key(model_name, backend)
+        cache = EmbeddingCache(ComponentIndexer.EMBEDDING_CACHE, key)
+        index = None
+        vectors = None
+        pending = []
+        total = 0
+        offsets = [0]
+        n_chunks = ComponentIndexer.count_chunks() if index_type == "flat" else 0
+        if index_type == "flat":
+            index_file, stale_file = ComponentIndexer.FLAT_VECTORS_FILE, ComponentIndexer.INDEX_FILE
+        else:
+            index_file, stale_file = ComponentIndexer.INDEX_FILE, ComponentIndexer.FLAT_VECTORS_FILE
+        # Everything is written to .tmp files and swapped in together at the end, so a failed or
+        # interrupted build leaves the previous index, metadata and offsets untouched
+        outputs = [index_file, ComponentIndexer.META_FILE, ComponentIndexer.OFFSETS_FILE, ComponentIndexer.ENCODER_FILE]
+        tmp = {path: path.with_name(path.name + ".tmp") for path in outputs}
+        print("Encoding texts from", ComponentIndexer.CHUNKS_FILE, "...")
+        try:
+            with open(tmp[ComponentIndexer.META_FILE], 'wb') as meta, tqdm(unit="chunk") as progress:
+                for texts, rows in ComponentIndexer.iter_chunk_windows(batch_size * window_batches):
+                    embeddings = cache.encode(texts, encode_misses)
+                    if index_type == "flat":
+                        if vectors is None:
+                            vectors = np.lib.format.open_memmap(tmp[index_file], mode="w+", dtype=np.float32,
+                                                                shape=(n_chunks, embeddings.shape[1]))
+                        vectors[total:total + len(rows)] = embeddings
+                    elif index_type in ("ivfpq", "hnsw_sq8"):
+                        pending.append(embeddings)
+                    else:
+                        if index is None:
+                            index = ComponentIndexer.create_index(embeddings.shape[1], 0, index_type)
+                        index.add(embeddings)
+                    del embeddings
+                    # Metadata rows line up with FAISS ids, which are assigned in insertion order
+                    for row in rows:
+                        meta.write(row)
+                        meta.write(b"\n")
+                        offsets.append(offsets[-1] + len(row) + 1)
+                    total += len(rows)
+                    progress.update(len(rows))
+            if not total:
+                raise ValueError(f"No chunks found in {ComponentIndexer.CHUNKS_FILE}")
+            cache.compact()
+            np.asarray(offsets, dtype=np.int64).tofile(tmp[ComponentIndexer.OFFSETS_FILE])
+            # The query CLI reads this back to load the same encoder for the queries
+            tmp[ComponentIndexer.ENCODER_FILE].write_text(
+                json.dumps({"model_name": model_name, "backend": backend, "key": key}))
+            if pending:
+                embeddings = np.vstack(pending)
+                index = ComponentIndexer.create_index(embeddings.shape[1], len(embeddings), index_type)
+                if not index.is_trained:
+                    index.train(embeddings)
+                index.add(embeddings)
+            if vectors is not None:
+                vectors.flush()
+                del vectors
+            else:
+                faiss.write_index(index, str(tmp[index_file]))
+        except BaseException:
+            for path in tmp.values():
+                path.unlink(missing_ok=True)
+            raise
+        for path in outputs:
+            os.replace(tmp[path], path)
+        # Remove the other index format so the query CLI picks up the one just built
+        stale_file.unlink(missing_ok=True)
+        print("Saved FAISS index with", total, "vectors to", index_file, "and metadata to", ComponentIndexer.META_FILE)
 
 if __name__ == "__main__":
     ComponentIndexer.build_index()
\ No newline at end of file
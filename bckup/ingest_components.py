@@ -1,16 +1,50 @@
+import contextlib
 import subprocess
 import json
+from decimal import Decimal
+from itertools import islice
 from pathlib import Path
-import ijson
 import gc
+import multiprocessing
 import os
 import sys
 
+# Prefer the C yajl2 backend; the pure-Python parser is several times slower
+try:
+    import ijson.backends.yajl2_c as ijson
+except ImportError:
+    try:
+        import ijson.backends.yajl2 as ijson
+    except ImportError:
+        import ijson
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 PROJECT_ROOT = Path(__file__).parent
 BUILD_INDEX_PATH = PROJECT_ROOT / "build-index"
 NODE_SCRIPT = PROJECT_ROOT / "scripts" / "extract-components.js"
 COMPONENT_DOCS = BUILD_INDEX_PATH / "component_docs.json"
-COMPONENT_CHUNKS = BUILD_INDEX_PATH / "component_chunks.json"
+COMPONENT_CHUNKS = BUILD_INDEX_PATH / "component_chunks.ndjson"
+
+
+def _json_default(obj):
+    # ijson yields non-integer numbers as Decimal
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_json_encoder = json.JSONEncoder(separators=(',', ':'), default=_json_default)
+
+
+def _dumps(obj):
+    """Compact JSON encoding of obj as UTF-8 bytes (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default)
+    return _json_encoder.encode(obj).encode('utf-8')
 
 
 class ComponentIngestor:
@@ -21,19 +55,14 @@ class ComponentIngestor:
     @staticmethod
     def chunk_text(text, max_chars=600, overlap=50):
         """Reduced chunk size and overlap to minimize memory usage."""
-        text = text.strip()
-        if not text:
-            return []
-        chunks = []
-        start = 0
-        L = len(text)
-        while start < L:
-            end = min(L, start + max_chars)
-            chunks.append(text[start:end].strip())
-            start = end - overlap
-            if start < 0:
-                start = 0
-        return chunks
+        # Collapse whitespace runs once up front so the slices below need no per-chunk strip()
+        text = ' '.join(text.split())
+        if len(text) <= max_chars:
+            # Most components fit in one chunk after truncation; skip the slicing entirely
+            return [text] if text else []
+        # Chunk starts form an arithmetic progression; stop once a chunk reaches the end of text
+        stride = max(1, max_chars - overlap)
+        return [text[s:s + max_chars] for s in range(0, max(len(text) - overlap, 1), stride)]
 
     @staticmethod
     def check_memory():
@@ -51,9 +80,12 @@ class ComponentIngestor:
             return None
 
     @staticmethod
-    def minimal_ingest(component_docs_path=None, output_chunks_path=None, max_components=None):
+    def minimal_ingest(component_docs_path=None, output_chunks_path=None, max_components=None, workers=1):
         """
-        Ultra-minimal memory approach: process one component at a time.
+        Ultra-minimal memory approach: stream components and chunk them in small windows.
+
+        Runs in-process by default; workers > 1 chunks each window of 64 components per
+        worker in a process pool and writes it in input order, so chunk ids match a serial run.
         """
         if component_docs_path is None:
             component_docs_path = ComponentIngestor.COMPONENT_DOCS
@@ -67,43 +99,39 @@ class ComponentIngestor:
         
         idx = 0
         processed_components = 0
+        workers = max(workers or 1, 1)
         
         # Create a temporary file to avoid keeping everything in memory
         temp_file = output_chunks_path.with_suffix('.tmp')
         
         try:
-            with open(temp_file, "w") as f_out:
-                f_out.write("[\n")
-                first_chunk = True
-                
-                with open(component_docs_path, "rb") as f_in:
+            # NDJSON: one chunk object per line, so readers can stream it
+            with open(temp_file, "wb") as f_out:
+                with open(component_docs_path, "rb") as f_in, ComponentIngestor._make_pool(workers) as pool:
                     docs = ijson.items(f_in, 'item')
+                    if max_components:
+                        docs = islice(docs, max_components)
                     
-                    for doc in docs:
-                        if max_components and processed_components >= max_components:
-                            break
+                    # The loop only creates short-lived acyclic objects that refcounting frees,
+                    # so pause the cyclic GC instead of collecting after every component
+                    gc.disable()
+                    try:
+                        # Buffer a bounded window so the pool never pulls the whole input into memory
+                        for window in iter(lambda: list(islice(docs, 64 * workers)), []):
+                            if pool is None:
+                                results = map(ComponentIngestor.build_component_chunks, window)
+                            else:
+                                results = pool.map(ComponentIngestor.build_component_chunks, window)
                             
-                        # Process single component
-                        chunks_written = ComponentIngestor.process_single_component(
-                            doc, f_out, idx, first_chunk
-                        )
-                        
-                        if chunks_written > 0:
-                            first_chunk = False
-                            idx += chunks_written
-                        
-                        processed_components += 1
-                        
-                        # Force cleanup after each component
-                        del doc
-                        gc.collect()
-                        
-                        # Progress update every 10 components
-                        if processed_components % 10 == 0:
+                            for result in results:
+                                idx += ComponentIngestor._write_chunks(result, f_out, idx)
+                            
+                            processed_components += len(window)
                             print(f"Processed {processed_components} components, {idx} chunks")
                             ComponentIngestor.check_memory()
-                
-                f_out.write("\n]\n")
+                    finally:
+                        gc.enable()
+                        gc.collect()
             
             # Move temp file to final location
             temp_file.rename(output_chunks_path)
@@ -116,10 +144,41 @@ class ComponentIngestor:
             raise e
 
     @staticmethod
-    def process_single_component(doc, f_out, start_idx, first_chunk):
+    def _make_pool(workers):
+        """Process pool for chunking, or a null context when running in-process."""
+        if workers <= 1:
+            return contextlib.nullcontext()
+        # fork makes worker startup cheap where it is available
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+        return multiprocessing.get_context(method).Pool(workers)
+
+    @staticmethod
+    def process_single_component(doc, f_out, start_idx):
         """Process a single component with minimal memory footprint."""
-        chunks_written = 0
-        
+        return ComponentIngestor._write_chunks(
+            ComponentIngestor.build_component_chunks(doc), f_out, start_idx
+        )
+
+    @staticmethod
+    def _write_chunks(result, f_out, start_idx):
+        """Write build_component_chunks output as NDJSON lines; returns the number written."""
+        if result is None:
+            return 0
+        name, component_id, file_path, chunks = result
+        for i, chunk_text in enumerate(chunks):
+            chunk_obj = {
+                "chunk_id": f"chunk_{start_idx + i}",
+                "component_id": component_id,
+                "component_name": name,
+                "file": file_path,
+                "text": chunk_text
+            }
+            f_out.write(_dumps(chunk_obj) + b"\n")
+        return len(chunks)
+
+    @staticmethod
+    def build_component_chunks(doc):
+        """Return (name, component_id, file, chunks) for one component, or None if it fails."""
         try:
             # Build text parts with strict size limits
             text_parts = []
@@ -174,29 +233,12 @@ class ComponentIngestor:
             # Create chunks
             chunks = ComponentIngestor.chunk_text(big_text, max_chars=500, overlap=30)
             
-            # Write chunks immediately
-            for i, chunk_text in enumerate(chunks):
-                chunk_obj = {
-                    "chunk_id": f"chunk_{start_idx + i}",
-                    "component_id": str(doc.get("id", ""))[:50],
-                    "component_name": name,
-                    "file": doc.get("file", "")[:100],
-                    "text": chunk_text
-                }
-                
-                if not first_chunk or i > 0:
-                    f_out.write(",\n")
-                
-                json.dump(chunk_obj, f_out, separators=(',', ':'))  # Compact JSON
-                chunks_written += 1
-            
-            # Cleanup
-            del text_parts, chunks, big_text
+            # Per-component fields are truncated once, not per chunk
+            return name, str(doc.get("id", ""))[:50], doc.get("file", "")[:100], chunks
             
         except Exception as e:
             print(f"Error processing component {doc.get('name', 'unknown')}: {e}")
-        
-        return chunks_written
+            return None
 
     @staticmethod
     def split_file_by_size(input_path=None, max_size_mb=50):
@@ -205,39 +247,49 @@ class ComponentIngestor:
         output_dir = input_path.parent
         max_size_bytes = max_size_mb * 1024 * 1024
         
-        part_num = 1
-        current_batch = []
-        current_size = 0
+        part_num = 0
+        part_count = 0
+        bytes_written = 0
+        f_out = None
         
-        with open(input_path, "rb") as f_in:
-            docs = ijson.items(f_in, 'item')
-            
-            for doc in docs:
-                doc_size = len(json.dumps(doc).encode('utf-8'))
+        try:
+            with open(input_path, "rb") as f_in:
+                docs = ijson.items(f_in, 'item')
                 
-                if current_size + doc_size > max_size_bytes and current_batch:
-                    # Write current batch
-                    out_path = output_dir / f"component_docs_part_{part_num}.json"
-                    with open(out_path, "w") as f_out:
-                        json.dump(current_batch, f_out, separators=(',', ':'))
+                for doc in docs:
+                    if f_out is None:
+                        part_num += 1
+                        f_out = open(output_dir / f"component_docs_part_{part_num}.json", "wb")
+                        f_out.write(b"[")
+                        part_count = 0
+                        bytes_written = 1
+                    else:
+                        f_out.write(b",")
+                        bytes_written += 1
                     
-                    print(f"Part {part_num}: {len(current_batch)} components, {current_size/1024/1024:.1f}MB")
+                    # Serialize each doc once, straight into the part file, and count bytes as we go
+                    data = _dumps(doc)
+                    f_out.write(data)
+                    bytes_written += len(data)
+                    part_count += 1
                     
-                    # Reset for next batch
-                    current_batch.clear()
-                    current_size = 0
-                    part_num += 1
-                    gc.collect()
+                    if bytes_written >= max_size_bytes:
+                        ComponentIngestor._close_part(f_out, part_num, part_count, bytes_written)
+                        f_out = None
                 
-                current_batch.append(doc)
-                current_size += doc_size
-            
-            # Write final batch
-            if current_batch:
-                out_path = output_dir / f"component_docs_part_{part_num}.json"
-                with open(out_path, "w") as f_out:
-                    json.dump(current_batch, f_out, separators=(',', ':'))
-                print(f"Part {part_num}: {len(current_batch)} components, {current_size/1024/1024:.1f}MB")
+                # Write final part
+                if f_out is not None:
+                    ComponentIngestor._close_part(f_out, part_num, part_count, bytes_written)
+                    f_out = None
+        finally:
+            if f_out is not None:
+                f_out.close()
+
+    @staticmethod
+    def _close_part(f_out, part_num, part_count, bytes_written):
+        f_out.write(b"]")
+        f_out.close()
+        print(f"Part {part_num}: {part_count} components, {(bytes_written + 1)/1024/1024:.1f}MB")
 
     @staticmethod
     def emergency_process(max_components=100):
@@ -248,25 +300,18 @@ class ComponentIngestor:
         # Ensure component_docs.json exists, run Node extractor if missing
         if not ComponentIngestor.COMPONENT_DOCS.exists():
             print(f"{ComponentIngestor.COMPONENT_DOCS} not found. Running Node extractor...")
-            process = subprocess.Popen(
+            # Node writes its progress straight to our stdout fd; no per-line decoding in Python
+            sys.stdout.flush()
+            process = subprocess.run(
                 ["node", str(ComponentIngestor.NODE_SCRIPT)],
-                stdout=subprocess.PIPE,
+                stdout=sys.stdout.buffer,
                 stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
+                check=False,
             )
-            for line in process.stdout:
-                print(line, end='')
-            process.stdout.close()
-            returncode = process.wait()
-            if returncode != 0:
-                err = process.stderr.read()
-                process.stderr.close()
+            if process.returncode != 0:
                 print("Node extractor failed:")
-                print(err)
+                print(process.stderr.decode('utf-8', errors='replace'))
                 raise SystemExit(1)
-            process.stderr.close()
             if not ComponentIngestor.COMPONENT_DOCS.exists():
                 print(f"{ComponentIngestor.COMPONENT_DOCS} still not found after running Node extractor.")
                 print("Emergency processing aborted.")
@@ -9,7 +9,7 @@ from sentence_transformers import SentenceTransformer
 class ComponentIndexer:
     PROJECT_ROOT = Path(__file__).parent
     BUILD_INDEX_PATH = PROJECT_ROOT / "build-index"
-    CHUNKS_FILE = BUILD_INDEX_PATH / "component_chunks.json"
+    CHUNKS_FILE = BUILD_INDEX_PATH / "component_chunks.ndjson"
     CHROMA_DB_PATH = BUILD_INDEX_PATH / "chromadb"
     
     def __init__(self, collection_name="component_chunks", model_name="all-MiniLM-L6-v2"):
@@ -84,9 +84,9 @@ class ComponentIndexer:
     
     def build_index(self, batch_size=64):
         """Build the ChromaDB index from component chunks"""
-        # Load chunks
-        with open(self.CHUNKS_FILE, 'r') as f:
-            chunks = json.load(f)
+        # Load chunks, one JSON object per line
+        with open(self.CHUNKS_FILE, 'rb') as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
         
         print(f"Encoding {len(chunks)} texts...")
         
@@ -138,7 +138,7 @@ class ComponentIndexer:
     @staticmethod
     def build_index_static(model_name="all-MiniLM-L6-v2", batch_size=64):
         """Static method to maintain compatibility with original API. Auto-create chunks if missing."""
-        chunks_file = Path(__file__).parent / "build-index" / "component_chunks.json"
+        chunks_file = Path(__file__).parent / "build-index" / "component_chunks.ndjson"
         if not chunks_file.exists():
             print(f"Chunks file not found: {chunks_file}")
             print("Running chunk creation...")
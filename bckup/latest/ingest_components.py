@@ -1,33 +1,114 @@
 """
-Create chunks.json from component_docs.json for embedding/search purposes
+Create component_chunks.ndjson from component_docs.json for embedding/search purposes
 """
+import contextlib
+import hashlib
 import json
+import multiprocessing
+from collections import Counter, OrderedDict
 import re
+from itertools import islice
 from pathlib import Path
 from typing import List, Dict, Any
 
+# Prefer the C yajl2 backend; the pure-Python parser is several times slower
+try:
+    import ijson.backends.yajl2_c as ijson
+except ImportError:
+    try:
+        import ijson.backends.yajl2 as ijson
+    except ImportError:
+        import ijson
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Compiled once at import; these run for every component and every prop description.
+# Each cleaner is a single alternation whose matches are dropped; whitespace is collapsed
+# separately with ' '.join(s.split()), which stays in C string code instead of the regex VM.
+_CLEAN_RE = re.compile(
+    r'import\s+.*?from\s+["\'].*?["\'];?'
+    r'|export\s+(?:default\s+)?'
+    r'|:\s*React\.\w+'
+    r'|React\.\w+<.*?>',
+    re.DOTALL
+)
+# Blanks whole import/export/`//` comment lines (JSDoc `///` is kept); the leftover
+# line breaks go with the whitespace collapse. The lookahead keeps a bare "import "
+# line, which the old strip-then-startswith check didn't treat as an import
+_DROP_LINES_RE = re.compile(
+    r'^[^\S\n]*(?:(?:import|export) (?=[^\n]*\S)|//(?!/))[^\n]*',
+    re.MULTILINE
+)
+_SPLIT_RE = re.compile(r'[.;{}]\s*')
+
+
+def _dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON encoding of obj (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _code_key(code: str) -> int:
+    """64-bit hash of a code body (xxh3 when available, else blake2b)"""
+    data = code.encode('utf-8', 'surrogatepass')
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def _chunk(chunk_id: str, component_id: str, component_name: str, file_path: str,
+           chunk_type: str, text: str) -> Dict[str, Any]:
+    """One chunk record; every chunk shares this key order"""
+    return {
+        "chunk_id": chunk_id,
+        "component_id": component_id,
+        "component_name": component_name,
+        "file": file_path,
+        "chunk_type": chunk_type,
+        "text": text
+    }
+
+
+# The ingestor that called create_chunks, handed to each pool worker by _init_worker
+_worker_ingestor = None
+
+
+def _init_worker(ingestor: "ComponentIngestor") -> None:
+    global _worker_ingestor
+    _worker_ingestor = ingestor
+
+
+def _extract_in_worker(component: Dict[str, Any]):
+    return _worker_ingestor._extract_safe(component)
+
+
 class ComponentIngestor:
+    # Distinct cleaned code bodies kept per ingestor, least recently used evicted first
+    CLEAN_CACHE_SIZE = 4096
+
     def __init__(self, input_path: str = None, output_path: str = None):
         self.input_path = Path(input_path) if input_path else Path("build-index/component_docs.json")
-        self.output_path = Path(output_path) if output_path else Path("build-index/component_chunks.json")
+        self.output_path = Path(output_path) if output_path else Path("build-index/component_chunks.ndjson")
+        # Cleaned code keyed by a hash of the raw body; re-exports and HOC wrappers repeat a lot
+        self._clean_cache: "OrderedDict[int, str]" = OrderedDict()
     
     def clean_text(self, text: str) -> str:
         """Clean and normalize text for better embedding quality"""
         if not text:
             return ""
         
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text.strip())
-        
-        # Remove common code artifacts that don't help with search
-        text = re.sub(r'import\s+.*?from\s+["\'].*?["\'];?', '', text)
-        text = re.sub(r'export\s+(default\s+)?', '', text)
-        
-        # Clean up JSX/TypeScript artifacts
-        text = re.sub(r':\s*React\.\w+', '', text)
-        text = re.sub(r'React\.\w+<.*?>', '', text)
-        
-        return text.strip()
+        # Collapse whitespace, then remove code artifacts that don't help with search
+        # (imports, export keywords, JSX/TypeScript React annotations) in one pass
+        return _CLEAN_RE.sub('', ' '.join(text.split())).strip()
 
     def extract_component_chunks(self, component: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Extract meaningful chunks from a single component"""
@@ -50,27 +131,15 @@ class ComponentIngestor:
             relevant_path = '/'.join(path_parts[-3:]) if len(path_parts) > 3 else file_path
             basic_info_parts.append(f"Location: {relevant_path}")
         
-        chunks.append({
-            "chunk_id": f"{component_id}_basic",
-            "component_id": component_id,
-            "component_name": component_name,
-            "file": file_path,
-            "chunk_type": "basic_info",
-            "text": " | ".join(basic_info_parts)
-        })
+        chunks.append(_chunk(f"{component_id}_basic", component_id, component_name, file_path,
+                             "basic_info", " | ".join(basic_info_parts)))
         
         # Chunk 2: Props information (if exists)
         if component.get('props') and isinstance(component['props'], dict):
             props_info = self.format_props_info(component['props'], component_name)
             if props_info:
-                chunks.append({
-                    "chunk_id": f"{component_id}_props",
-                    "component_id": component_id,
-                    "component_name": component_name,
-                    "file": file_path,
-                    "chunk_type": "props",
-                    "text": props_info
-                })
+                chunks.append(_chunk(f"{component_id}_props", component_id, component_name, file_path,
+                                     "props", props_info))
         
         # Chunk 3: Code snippet (if exists and meaningful)
         if component.get('raw'):
@@ -143,61 +212,37 @@ class ComponentIngestor:
         if not raw_code or len(raw_code.strip()) < 50:
             return []
         
-        # Clean the code
-        cleaned_code = self.clean_code_for_search(raw_code)
+        # Clean the code, reusing the result for bodies seen before
+        key = _code_key(raw_code)
+        cleaned_code = self._clean_cache.get(key)
+        if cleaned_code is None:
+            cleaned_code = self.clean_code_for_search(raw_code)
+            self._clean_cache[key] = cleaned_code
+            if len(self._clean_cache) > self.CLEAN_CACHE_SIZE:
+                self._clean_cache.popitem(last=False)
+        else:
+            self._clean_cache.move_to_end(key)
         
         # If code is short enough, create single chunk
         if len(cleaned_code) <= 600:
-            return [{
-                "chunk_id": f"{component_id}_code",
-                "component_id": component_id,
-                "component_name": component_name,
-                "file": file_path,
-                "chunk_type": "code",
-                "text": f"{component_name} implementation: {cleaned_code}"
-            }]
+            return [_chunk(f"{component_id}_code", component_id, component_name, file_path,
+                           "code", f"{component_name} implementation: {cleaned_code}")]
         
-        # Split longer code into chunks
-        chunks = []
+        # Split longer code into chunks; the id and text prefixes are built once per component
         code_chunks = self.split_code(cleaned_code, max_length=500)
+        id_prefix = f"{component_id}_code_"
+        text_prefix = f"{component_name} code part "
         
-        for i, chunk in enumerate(code_chunks):
-            chunks.append({
-                "chunk_id": f"{component_id}_code_{i}",
-                "component_id": component_id,
-                "component_name": component_name,
-                "file": file_path,
-                "chunk_type": "code",
-                "text": f"{component_name} code part {i+1}: {chunk}"
-            })
-        
-        return chunks
+        return [
+            _chunk(id_prefix + str(i), component_id, component_name, file_path,
+                   "code", f"{text_prefix}{i + 1}: {chunk}")
+            for i, chunk in enumerate(code_chunks)
+        ]
     
     def clean_code_for_search(self, code: str) -> str:
         """Clean code to make it more searchable"""
-        # Remove imports
-        lines = code.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            
-            # Skip empty lines and imports
-            if not line or line.startswith('import ') or line.startswith('export '):
-                continue
-            
-            # Skip comments (but keep JSDoc comments as they're useful)
-            if line.startswith('//') and not line.startswith('///'):
-                continue
-            
-            cleaned_lines.append(line)
-        
-        cleaned_code = ' '.join(cleaned_lines)
-        
-        # Remove excessive whitespace
-        cleaned_code = re.sub(r'\s+', ' ', cleaned_code)
-        
-        return cleaned_code.strip()
+        # Drop import/export lines and non-JSDoc comments, collapse whitespace
+        return ' '.join(_DROP_LINES_RE.sub('', code).split())
     
     def split_code(self, code: str, max_length: int = 500) -> List[str]:
         """Split code into chunks while trying to preserve meaning"""
@@ -205,10 +250,12 @@ class ComponentIngestor:
             return [code]
         
         chunks = []
-        current_chunk = ""
+        # Sentences of the current chunk, joined once on flush; buf_len is the joined length
+        buf = []
+        buf_len = 0
         
         # Split by sentences/statements first
-        sentences = re.split(r'[.;{}]\s*', code)
+        sentences = _SPLIT_RE.split(code)
         
         for sentence in sentences:
             sentence = sentence.strip()
@@ -216,44 +263,64 @@ class ComponentIngestor:
                 continue
             
             # If adding this sentence exceeds limit, save current chunk
-            if len(current_chunk) + len(sentence) > max_length and current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence
+            if buf_len + len(sentence) > max_length and buf:
+                chunks.append(' '.join(buf))
+                buf = [sentence]
+                buf_len = len(sentence)
             else:
-                if current_chunk:
-                    current_chunk += " " + sentence
-                else:
-                    current_chunk = sentence
+                buf_len += len(sentence) + 1 if buf else len(sentence)
+                buf.append(sentence)
         
         # Add remaining chunk
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        if buf:
+            chunks.append(' '.join(buf))
         
         return chunks
     
-    def create_chunks(self, max_components: int = None) -> None:
-        """Main method to create chunks from component docs"""
+    def _extract_safe(self, component: Dict[str, Any]):
+        """Returns (chunks, None), or (None, error message) so one bad component
+        doesn't abort the whole window"""
+        try:
+            return self.extract_component_chunks(component), None
+        except Exception as e:
+            return None, f"Error processing component {component.get('name', 'unknown')}: {e}"
+
+    def _make_pool(self, workers: int):
+        """Process pool whose workers chunk with a copy of this ingestor, or a null
+        context when running in-process"""
+        if workers <= 1:
+            return contextlib.nullcontext()
+        # fork makes worker startup cheap where it is available
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+        return multiprocessing.get_context(method).Pool(workers, initializer=_init_worker, initargs=(self,))
+
+    def create_chunks(self, max_components: int = None, workers: int = 1) -> None:
+        """Main method to create chunks from component docs
+
+        With workers > 1, components are chunked in windows of 64 per worker across a
+        process pool and written in input order; the default stays in-process.
+        """
         if not self.input_path.exists():
             print(f"Component docs file not found: {self.input_path}")
             # Try to run Node extractor to generate component_docs.json
             node_script = Path(__file__).parent / "scripts" / "extract-components.js"
             if node_script.exists():
                 import subprocess
+                import sys
                 print(f"Running Node extractor: {node_script}")
-                process = subprocess.Popen([
-                    "node", str(node_script)
-                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                for line in process.stdout:
-                    print(line, end='')
-                process.stdout.close()
-                returncode = process.wait()
-                if returncode != 0:
-                    err = process.stderr.read()
-                    process.stderr.close()
+                # Node writes its progress straight to our stdout fd; no per-line decoding in
+                # Python, and run() drains stderr alongside so a chatty extractor can't block
+                sys.stdout.flush()
+                process = subprocess.run(
+                    ["node", str(node_script)],
+                    stdout=sys.stdout.buffer,
+                    stderr=subprocess.PIPE,
+                    check=False,
+                )
+                if process.returncode != 0:
                     print("Node extractor failed:")
-                    print(err)
+                    print(process.stderr.decode('utf-8', errors='replace'))
                     raise RuntimeError("Node extractor failed")
-                process.stderr.close()
                 if not self.input_path.exists():
                     raise FileNotFoundError(f"Component docs file still not found after running Node extractor: {self.input_path}")
             else:
@@ -261,43 +328,48 @@ class ComponentIngestor:
 
         print(f"Loading components from {self.input_path}")
 
-        with open(self.input_path, 'r', encoding='utf-8') as f:
-            components = json.load(f)
-
-        if max_components:
-            components = components[:max_components]
-            print(f"Processing first {len(components)} components for testing")
+        # Create output directory if it doesn't exist
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        all_chunks = []
+        processed = 0
+        total_chunks = 0
+        chunk_types = Counter()
+        workers = max(workers or 1, 1)
 
-        for i, component in enumerate(components):
-            try:
-                component_chunks = self.extract_component_chunks(component)
-                all_chunks.extend(component_chunks)
+        # Stream components in and chunks out, so neither file is ever fully in memory.
+        # NDJSON: one chunk object per line, so readers can stream it too
+        with open(self.input_path, 'rb') as f_in, open(self.output_path, 'wb') as f_out, \
+                self._make_pool(workers) as pool:
+            components = ijson.items(f_in, 'item')
+            if max_components:
+                components = islice(components, max_components)
+                print(f"Processing first {max_components} components for testing")
 
-                if (i + 1) % 10 == 0:
-                    print(f"Processed {i + 1} components, generated {len(all_chunks)} chunks so far")
+            # Buffer a bounded window so the pool never pulls the whole input into memory
+            for window in iter(lambda: list(islice(components, 64 * workers)), []):
+                if pool is None:
+                    results = map(self._extract_safe, window)
+                else:
+                    results = pool.map(_extract_in_worker, window)
 
-            except Exception as e:
-                print(f"Error processing component {component.get('name', 'unknown')}: {e}")
-                continue
+                for component_chunks, error in results:
+                    if error:
+                        print(error)
+                        continue
 
-        # Create output directory if it doesn't exist
-        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+                    for chunk in component_chunks:
+                        f_out.write(_dumps(chunk))
+                        f_out.write(b'\n')
+                    total_chunks += len(component_chunks)
+                    chunk_types.update(chunk.get('chunk_type', 'unknown') for chunk in component_chunks)
 
-        # Write chunks to file
-        with open(self.output_path, 'w', encoding='utf-8') as f:
-            json.dump(all_chunks, f, indent=2, ensure_ascii=False)
+                processed += len(window)
+                print(f"Processed {processed} components, generated {total_chunks} chunks so far")
 
-        print(f"Created {len(all_chunks)} chunks from {len(components)} components")
+        print(f"Created {total_chunks} chunks from {processed} components")
         print(f"Output saved to: {self.output_path}")
 
         # Print statistics
-        chunk_types = {}
-        for chunk in all_chunks:
-            chunk_type = chunk.get('chunk_type', 'unknown')
-            chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + 1
-
         print("\nChunk types created:")
         for chunk_type, count in chunk_types.items():
             print(f"  {chunk_type}: {count}")
@@ -309,13 +381,15 @@ def main():
     
     parser = argparse.ArgumentParser(description='Create chunks from component docs for embeddings')
     parser.add_argument('--input', help='Input component_docs.json file path')
-    parser.add_argument('--output', help='Output chunks.json file path')
+    parser.add_argument('--output', help='Output component_chunks.ndjson file path')
     parser.add_argument('--max-components', type=int, help='Maximum number of components to process (for testing)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Chunking processes (default: 1, in-process)')
     
     args = parser.parse_args()
     
     chunker = ComponentIngestor(args.input, args.output)
-    chunker.create_chunks(args.max_components)
+    chunker.create_chunks(args.max_components, args.workers)
 
 
 if __name__ == "__main__":
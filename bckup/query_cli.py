@@ -1,32 +1,78 @@
 # query_cli.py
-import json
+from heapq import nlargest
+import mmap
+from operator import itemgetter
 from pathlib import Path
+import sys
+from typing import List, Optional
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import typer
 
+# The index is queried with the encoder it was built with, loaded through the shared embedding_utils
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from embedding_utils import load_model, resolve_backend
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 app = typer.Typer()
 PROJECT_ROOT = Path(__file__).parent
-INDEX_FILE = PROJECT_ROOT / "components.faiss"
-META_FILE = PROJECT_ROOT / "chunks_meta.json"
+BUILD_INDEX_PATH = PROJECT_ROOT / "build-index"
+INDEX_FILE = BUILD_INDEX_PATH / "components.faiss"
+FLAT_VECTORS_FILE = INDEX_FILE.with_suffix(".npy")
+META_FILE = BUILD_INDEX_PATH / "chunks_meta.ndjson"
+OFFSETS_FILE = BUILD_INDEX_PATH / "chunks_offsets.i64"
+ENCODER_FILE = BUILD_INDEX_PATH / "encoder.json"
+ONNX_CACHE_PATH = BUILD_INDEX_PATH / "onnx"
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
-index = faiss.read_index(str(INDEX_FILE))
-with open(META_FILE) as f:
-    chunks = json.load(f)
 
-@app.command()
-def query(q: str, k: int = 5, per_component: int = 1):
-    # embed + normalize
-    q_emb = model.encode([q], convert_to_numpy=True)
-    faiss.normalize_L2(q_emb)
-    D, I = index.search(q_emb, k)  # returns top-k chunk indices
-    # I shape (1, k)
+class ChunkMeta:
+    """Read-only view of the NDJSON metadata: the file is mmapped and a row is only
+    decoded when it is looked up, using the line offsets written by the indexer."""
+
+    def __init__(self, meta_file, offsets_file):
+        with open(meta_file, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = np.fromfile(offsets_file, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        # Each line ends with a newline, which the slice leaves out
+        return json_loads(self.mm[self.offsets[idx]:self.offsets[idx + 1] - 1])
+
+
+if not ENCODER_FILE.exists():
+    sys.exit(f"{ENCODER_FILE} not found; rebuild the index with index_components-1.py")
+encoder = json_loads(ENCODER_FILE.read_bytes())
+# int8 ONNX and torch vectors live in different spaces; only the torch dtype may differ from the build
+if resolve_backend(encoder["backend"]) != encoder["backend"]:
+    sys.exit(f"Index was built with encoder {encoder['key']}, which is not available here")
+model = load_model(encoder["model_name"], encoder["backend"], ONNX_CACHE_PATH)
+if FLAT_VECTORS_FILE.exists():
+    # Flat index saved as a raw embedding matrix; mmap it so the OS page cache backs the load
+    vectors = np.load(FLAT_VECTORS_FILE, mmap_mode="r")
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    del vectors
+else:
+    index = faiss.read_index(str(INDEX_FILE))
+    # Search-time knobs for the approximate indexes: lists probed for IVF, beam width for HNSW
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = 8
+    elif hasattr(index, "hnsw"):
+        index.hnsw.efSearch = 64
+chunks = ChunkMeta(META_FILE, OFFSETS_FILE)
+
+def aggregate_hits(scores, ids, per_component: int = 1):
     hits = []
-    for score, idx in zip(D[0], I[0]):
-        if idx < 0:
-            continue
+    # FAISS pads missing results with id -1; tolist() converts the rest to Python ints/floats in one call
+    mask = ids >= 0
+    for idx, score in zip(ids[mask].tolist(), scores[mask].tolist()):
         meta = chunks[idx]
         hits.append({
             "component_id": meta["component_id"],
@@ -34,7 +80,7 @@ def query(q: str, k: int = 5, per_component: int = 1):
             "file": meta["file"],
             "chunk_id": meta["chunk_id"],
             "text": meta["text"],
-            "score": float(score)
+            "score": score
         })
     # Aggregate by component: keep top-scoring chunk(s) per component
     grouped = {}
@@ -44,24 +90,45 @@ def query(q: str, k: int = 5, per_component: int = 1):
     # Build result list ordered by best score per component
     results = []
     for cid, hs in grouped.items():
-        hs_sorted = sorted(hs, key=lambda x: -x["score"])
+        # Only the top per_component hits are needed, so take them off a heap instead of sorting
+        top = nlargest(max(per_component, 1), hs, key=itemgetter("score"))
         results.append({
             "component_id": cid,
-            "component_name": hs_sorted[0]["component_name"],
-            "file": hs_sorted[0]["file"],
-            "best_score": hs_sorted[0]["score"],
-            "top_chunks": hs_sorted[:per_component]
+            "component_name": top[0]["component_name"],
+            "file": top[0]["file"],
+            "best_score": top[0]["score"],
+            "top_chunks": top[:per_component]
         })
-    results.sort(key=lambda x: -x["best_score"])
-    # Print
-    for r in results:
-        print(f"\nComponent: {r['component_name']}  (score: {r['best_score']:.4f})")
-        print("File:", r['file'])
-        for c in r["top_chunks"]:
-            print("--- snippet ---")
-            print(c["text"][:800].strip())
-    if not results:
-        print("No matches found.")
+    results.sort(key=itemgetter("best_score"), reverse=True)
+    return results
+
+@app.command()
+def query(q: Optional[List[str]] = typer.Argument(None), k: int = 5, per_component: int = 1,
+          batch_size: int = 32):
+    # One query per argument, or one per stdin line when none are given and stdin is piped
+    qs = q
+    if not qs and not sys.stdin.isatty():
+        qs = [line.strip() for line in sys.stdin if line.strip()]
+    if not qs:
+        raise typer.BadParameter("give at least one query, or pipe queries on stdin", param_hint="Q")
+    # Index vectors are L2-normalized at build time, so normalizing the queries
+    # inside encode makes inner product equal cosine without a separate pass
+    q_emb = model.encode(qs, batch_size=batch_size, convert_to_numpy=True,
+                         normalize_embeddings=True).astype("float32", copy=False)
+    D, I = index.search(q_emb, k)  # returns top-k chunk indices, shape (len(qs), k)
+    for qi, text in enumerate(qs):
+        if len(qs) > 1:
+            print(f"\n=== {text} ===")
+        results = aggregate_hits(D[qi], I[qi], per_component)
+        # Print
+        for r in results:
+            print(f"\nComponent: {r['component_name']}  (score: {r['best_score']:.4f})")
+            print("File:", r['file'])
+            for c in r["top_chunks"]:
+                print("--- snippet ---")
+                print(c["text"][:800].strip())
+        if not results:
+            print("No matches found.")
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -1,18 +1,113 @@
+from importlib.util import find_spec
+from pathlib import Path
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 
+ONNX_CACHE_PATH = Path(__file__).parent / "build-index" / "onnx"
+
+
+def precision_name():
+    """The dtype reduce_precision will pick on this machine: "fp16", "bf16" or "fp32"."""
+    if torch.cuda.is_available():
+        return "fp16"
+    try:
+        bf16_supported = torch.cpu._is_avx512_bf16_supported()
+    except AttributeError:
+        bf16_supported = False
+    return "bf16" if bf16_supported else "fp32"
+
+
+def reduce_precision(model):
+    """Run the model in fp16 on GPU, or bf16 on CPUs with native AVX512-BF16 support."""
+    precision = precision_name()
+    if precision == "fp16":
+        return model.half()
+    if precision == "bf16":
+        return model.to(torch.bfloat16)
+    return model
+
+
+class OnnxEncoder:
+    """Drop-in for SentenceTransformer.encode backed by an int8-quantized ONNX Runtime export."""
+
+    def __init__(self, model_name, cache_dir=ONNX_CACHE_PATH, max_seq_length=256):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+
+        model_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        model_dir = Path(cache_dir) / model_id.replace("/", "__")
+        if not (model_dir / "model_quantized.onnx").exists():
+            # One-time export + dynamic int8 quantization (VNNI kernels), cached for later runs
+            print("Exporting", model_id, "to ONNX...")
+            exported = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+            quantizer = ORTQuantizer.from_pretrained(exported)
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=model_dir, quantization_config=qconfig)
+            AutoTokenizer.from_pretrained(model_id).save_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name="model_quantized.onnx", provider="CPUExecutionProvider"
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = max_seq_length
+
+    def encode(self, texts, batch_size=64, normalize_embeddings=False, **kwargs):
+        out = []
+        for i in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(texts[i:i + batch_size], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            token_embeddings = self.model(**inputs).last_hidden_state
+            # Mean pooling over non-padding tokens
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            emb = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            out.append(emb.astype(np.float32, copy=False))
+        return np.concatenate(out) if out else np.empty((0, 0), dtype=np.float32)
+
+
+def resolve_backend(backend="torch"):
+    """The backend load_model will actually use: "onnx" needs optimum and onnxruntime."""
+    if backend == "onnx" and not (find_spec("optimum") and find_spec("onnxruntime")):
+        print("optimum[onnxruntime] not installed, falling back to SentenceTransformer")
+        return "torch"
+    return backend
+
+
+def encoder_key(model_name="all-MiniLM-L6-v2", backend="torch"):
+    """Names the vectors load_model(model_name, backend) produces on this machine."""
+    if resolve_backend(backend) == "onnx":
+        return f"{model_name}:onnx-int8"
+    return f"{model_name}:torch-{precision_name()}"
+
+
+def load_model(model_name="all-MiniLM-L6-v2", backend="torch", cache_dir=ONNX_CACHE_PATH):
+    """Load the encoder; backend="onnx" opts into the int8 ONNX Runtime export when optimum is installed."""
+    if resolve_backend(backend) == "onnx":
+        return OnnxEncoder(model_name, cache_dir)
+    return reduce_precision(SentenceTransformer(model_name))
+
+
 class SentenceTransformerEmbeddings:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name="all-MiniLM-L6-v2", backend="torch"):
+        # Resolved up front so name() reports the encoder that really produced the vectors
+        self.backend = resolve_backend(backend)
+        self.model = load_model(model_name, self.backend)
         self.model_name = model_name
 
     def __call__(self, input):
-        # ChromaDB expects input to be a list of strings
-        return self.model.encode(input, convert_to_numpy=True).tolist()
+        # ChromaDB expects input to be a list of strings; unit vectors match the pre-encoded index.
+        # The float32 array is handed back as-is, ChromaDB accepts numpy embeddings directly
+        return self.model.encode(input, convert_to_numpy=True, normalize_embeddings=True)
 
     def name(self):
+        # Vectors from different backends don't mix, so the name tells them apart
+        if self.backend == "onnx":
+            return "sentence-transformers-onnx-int8"
         return "sentence-transformers"
 
 
-def get_embedding_function(model_name="all-MiniLM-L6-v2"):
+def get_embedding_function(model_name="all-MiniLM-L6-v2", backend="torch"):
     """Return a ChromaDB-compatible embedding function using SentenceTransformers."""
-    return SentenceTransformerEmbeddings(model_name)
+    return SentenceTransformerEmbeddings(model_name, backend)
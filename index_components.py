@@ -1,6 +1,8 @@
 # index_components.py
 import json
+import os
 from pathlib import Path
+import torch
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
@@ -9,19 +11,31 @@ from sentence_transformers import SentenceTransformer
 class ComponentIndexer:
     PROJECT_ROOT = Path(__file__).parent
     BUILD_INDEX_PATH = PROJECT_ROOT / "build-index"
-    CHUNKS_FILE = BUILD_INDEX_PATH / "component_chunks.json"
+    CHUNKS_FILE = BUILD_INDEX_PATH / "component_chunks.ndjson"
     CHROMA_DB_PATH = BUILD_INDEX_PATH / "chromadb"
     
-    def __init__(self, collection_name="component_chunks", model_name="all-MiniLM-L6-v2"):
+    def __init__(self, collection_name="component_chunks", model_name="all-MiniLM-L6-v2", backend="torch"):
         self.collection_name = collection_name
         self.model_name = model_name
+        self.backend = backend
         self.model = None
+        self.embedding_function = None
         self.client = None
         self.collection = None
+        
+        # Use every core for intra-op matmuls; inter-op threads can only be set once per process
+        torch.set_num_threads(os.cpu_count() or 1)
+        try:
+            torch.set_num_interop_threads(2)
+        except RuntimeError:
+            pass
     
     def _get_embedding_function(self):
-        from embedding_utils import get_embedding_function
-        return get_embedding_function(self.model_name)
+        if self.embedding_function is None:
+            from embedding_utils import get_embedding_function
+            self.embedding_function = get_embedding_function(self.model_name, self.backend)
+            self.model = self.embedding_function.model
+        return self.embedding_function
     
     def _get_client(self):
         """Initialize ChromaDB client"""
@@ -48,7 +62,8 @@ class ComponentIndexer:
                     self.collection = client.create_collection(
                         name=self.collection_name,
                         embedding_function=embedding_function,
-                        metadata={"hnsw:space": "cosine"}  # Use cosine similarity
+                        # Cosine similarity; the backend lets the query side detect a mismatched encoder
+                        metadata={"hnsw:space": "cosine", "embedding_backend": embedding_function.backend}
                     )
                     print(f"Created new collection '{self.collection_name}'")
                 except Exception:
@@ -72,27 +87,25 @@ class ComponentIndexer:
         
         return self.collection
     
-    def build_index(self, batch_size=64):
+    def build_index(self, batch_size=64, encode_batch_size=256):
         """Build the ChromaDB index from component chunks"""
-        # Load chunks
-        with open(self.CHUNKS_FILE, 'r') as f:
-            chunks = json.load(f)
+        # Load chunks, one JSON object per line
+        with open(self.CHUNKS_FILE, 'rb') as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
         
         print(f"Encoding {len(chunks)} texts...")
         
+        # Drop any existing collection instead of fetching every row just to delete it
+        try:
+            self._get_client().delete_collection(name=self.collection_name)
+            print("Dropped existing collection data")
+        except Exception:
+            pass  # Collection does not exist yet
+        self.collection = None
+        
         # Get collection
         collection = self._get_collection()
         
-        # Clear existing data if any
-        try:
-            # Get all existing IDs and delete them
-            existing = collection.get()
-            if existing['ids']:
-                collection.delete(ids=existing['ids'])
-                print("Cleared existing collection data")
-        except:
-            pass  # Collection might be empty
-        
         # Prepare data for ChromaDB
         texts = []
         metadatas = []
@@ -105,16 +118,29 @@ class ComponentIndexer:
             metadatas.append(metadata)
             ids.append(f"chunk_{i}")
         
+        # Add documents in length-sorted order so each embedding batch pads to similar lengths
+        order = sorted(range(len(texts)), key=lambda j: len(texts[j]))
+        
+        # Encode everything once up front instead of letting ChromaDB call the embedding function per batch
+        embeddings = self.model.encode(
+            [texts[j] for j in order],
+            batch_size=encode_batch_size,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype("float32", copy=False)
+        
         # Add documents to collection in batches
         print(f"Adding {len(texts)} documents to ChromaDB...")
         
         for i in range(0, len(texts), batch_size):
-            batch_end = min(i + batch_size, len(texts))
-            batch_texts = texts[i:batch_end]
-            batch_metadatas = metadatas[i:batch_end]
-            batch_ids = ids[i:batch_end]
+            batch_order = order[i:i + batch_size]
+            batch_texts = [texts[j] for j in batch_order]
+            batch_metadatas = [metadatas[j] for j in batch_order]
+            batch_ids = [ids[j] for j in batch_order]
             
             collection.add(
+                embeddings=embeddings[i:i + batch_size].tolist(),
                 documents=batch_texts,
                 metadatas=batch_metadatas,
                 ids=batch_ids
@@ -126,17 +152,23 @@ class ComponentIndexer:
         print(f"Collection '{self.collection_name}' contains {collection.count()} documents")
     
     @staticmethod
-    def build_index_static(model_name="all-MiniLM-L6-v2", batch_size=64):
+    def build_index_static(model_name="all-MiniLM-L6-v2", batch_size=64, backend="torch"):
         """Static method to maintain compatibility with original API. Auto-create chunks if missing."""
-        chunks_file = Path(__file__).parent / "build-index" / "component_chunks.json"
+        chunks_file = ComponentIndexer.CHUNKS_FILE
         if not chunks_file.exists():
             print(f"Chunks file not found: {chunks_file}")
             print("Running chunk creation...")
-            chunker = ComponentChunker()
-            chunker.create_chunks()
+            # Chunk in this process rather than spawning `python3 ingest_components.py`
+            from ingest_components import ComponentIngestor
+            chunker = ComponentIngestor(
+                input_path=str(ComponentIndexer.BUILD_INDEX_PATH / "component_docs.json"),
+                output_path=str(chunks_file)
+            )
+            # Serial: this process has already imported torch and chromadb, so don't fork it
+            chunker.create_chunks(workers=1)
             print(f"Created chunks file: {chunks_file}")
         
-        indexer = ComponentIndexer(model_name=model_name)
+        indexer = ComponentIndexer(model_name=model_name, backend=backend)
         indexer.build_index(batch_size=batch_size)
 
 if __name__ == "__main__":
@@ -1,31 +1,37 @@
 import json
+import os
+import socket
+from heapq import nlargest
+from operator import itemgetter
 from pathlib import Path
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 import typer
 from typing import List, Dict, Any
 
 app = typer.Typer()
 
 class ComponentQueryer:
-    def __init__(self, collection_name="component_chunks", model_name="all-MiniLM-L6-v2"):
+    def __init__(self, collection_name="component_chunks", model_name="all-MiniLM-L6-v2", backend="torch"):
         self.PROJECT_ROOT = Path(__file__).parent
         self.BUILD_INDEX_PATH = self.PROJECT_ROOT / "build-index"
         self.CHROMA_DB_PATH = self.BUILD_INDEX_PATH / "chromadb"
+        self.SOCKET_PATH = self.BUILD_INDEX_PATH / "query.sock"
         self.collection_name = collection_name
         self.model_name = model_name
+        self.backend = backend
         self.model = None
         self.client = None
         self.collection = None
     
     def _get_embedding_function(self):
         from embedding_utils import get_embedding_function
-        return get_embedding_function(self.model_name)
+        return get_embedding_function(self.model_name, self.backend)
     
     def _get_client(self):
         """Initialize ChromaDB client"""
         if self.client is None:
+            # Imported here so a query forwarded to the `serve` daemon never loads chromadb
+            import chromadb
+            from chromadb.config import Settings
             self.client = chromadb.PersistentClient(
                 path=str(self.CHROMA_DB_PATH),
                 settings=Settings(anonymized_telemetry=False)
@@ -45,6 +51,15 @@ class ComponentQueryer:
                 )
             except ValueError:
                 raise ValueError(f"Collection '{self.collection_name}' not found. Please run index_components.py first.")
+            
+            # Query vectors must come from the same encoder as the indexed ones
+            built_with = (self.collection.metadata or {}).get("embedding_backend", "torch")
+            if built_with != embedding_function.backend:
+                self.collection = None
+                raise ValueError(
+                    f"Collection '{self.collection_name}' was indexed with the '{built_with}' embedding backend, "
+                    f"but queries would use '{embedding_function.backend}'. Pass --backend {built_with}."
+                )
         
         return self.collection
     
@@ -89,23 +104,61 @@ class ComponentQueryer:
         # Build result list ordered by best score per component
         results = []
         for cid, hs in grouped.items():
-            hs_sorted = sorted(hs, key=lambda x: -x["score"])
+            # Only the top per_component hits are needed, so take them off a heap instead of sorting
+            top = nlargest(max(per_component, 1), hs, key=itemgetter("score"))
             results.append({
                 "component_id": cid,
-                "component_name": hs_sorted[0]["component_name"],
-                "file": hs_sorted[0]["file"],
-                "best_score": hs_sorted[0]["score"],
-                "top_chunks": hs_sorted[:per_component]
+                "component_name": top[0]["component_name"],
+                "file": top[0]["file"],
+                "best_score": top[0]["score"],
+                "top_chunks": top[:per_component]
             })
         
-        results.sort(key=lambda x: -x["best_score"])
+        results.sort(key=itemgetter("best_score"), reverse=True)
         return results
 
+    def query_daemon(self, query_text: str, k: int = 5, per_component: int = 1, timeout: float = 30.0):
+        """Send the query to a running `serve` daemon; returns None if no daemon answers in time"""
+        if not self.SOCKET_PATH.exists():
+            return None
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(str(self.SOCKET_PATH))
+                request = {"q": query_text, "k": k, "per_component": per_component, "backend": self.backend}
+                sock.sendall(json.dumps(request).encode() + b"\n")
+                with sock.makefile("rb") as f:
+                    line = f.readline()
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None
+        except socket.timeout:
+            print(f"Query daemon did not answer within {timeout:g}s, querying in-process")
+            return None
+        if not line:
+            # Daemon closed the connection without replying
+            return None
+        response = json.loads(line)
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["results"]
+
 # Global queryer instance
 queryer = ComponentQueryer()
 
+def print_results(results: List[Dict[str, Any]]):
+    """Print results in the same format as the original"""
+    for r in results:
+        print(f"\nComponent: {r['component_name']}  (score: {r['best_score']:.4f})")
+        print("File:", r['file'])
+        for c in r["top_chunks"]:
+            print("--- snippet ---")
+            print(c["text"][:800].strip())
+    
+    if not results:
+        print("No matches found.")
+
 @app.command()
-def query(q: str, k: int = 5, per_component: int = 1):
+def query(q: str, k: int = 5, per_component: int = 1, backend: str = "torch"):
     """
     Query the component database for similar components.
     
@@ -113,20 +166,14 @@ def query(q: str, k: int = 5, per_component: int = 1):
         q: Query string to search for
         k: Number of top chunks to retrieve
         per_component: Number of chunks to show per component
+        backend: Embedding backend the index was built with ("torch" or "onnx")
     """
+    queryer.backend = backend
     try:
-        results = queryer.query_components(q, k, per_component)
-        
-        # Print results in the same format as the original
-        for r in results:
-            print(f"\nComponent: {r['component_name']}  (score: {r['best_score']:.4f})")
-            print("File:", r['file'])
-            for c in r["top_chunks"]:
-                print("--- snippet ---")
-                print(c["text"][:800].strip())
-        
-        if not results:
-            print("No matches found.")
+        results = queryer.query_daemon(q, k, per_component)
+        if results is None:
+            results = queryer.query_components(q, k, per_component)
+        print_results(results)
             
     except ValueError as e:
         print(f"Error: {e}")
@@ -135,16 +182,78 @@ def query(q: str, k: int = 5, per_component: int = 1):
         print(f"Unexpected error: {e}")
 
 @app.command()
-def info():
+def info(backend: str = "torch"):
     """Show information about the component database."""
+    queryer.backend = backend
     try:
         collection = queryer._get_collection()
         count = collection.count()
         print(f"Component database contains {count} chunks")
         print(f"Database location: {queryer.CHROMA_DB_PATH}")
         print(f"Collection name: {queryer.collection_name}")
+        print(f"Embedding backend: {(collection.metadata or {}).get('embedding_backend', 'torch')}")
     except Exception as e:
         print(f"Error getting database info: {e}")
 
+@app.command()
+def serve(backend: str = "torch"):
+    """
+    Keep the model and collection loaded and answer queries over a Unix socket.
+    
+    Each request is one JSON line {"q": ..., "k": ..., "per_component": ...} and gets
+    one JSON line back. While this is running, `query` forwards to it instead of
+    loading everything itself.
+    """
+    socket_path = str(queryer.SOCKET_PATH)
+    if os.path.exists(socket_path):
+        # Only a socket nobody is listening on is stale; never take over a running daemon's path
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(socket_path)
+            else:
+                print(f"Error: query daemon already running on {socket_path}")
+                return
+    queryer.backend = backend
+    try:
+        queryer._get_collection()
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        print(f"Serving queries on {socket_path} (Ctrl+C to stop)")
+        try:
+            while True:
+                conn, _ = server.accept()
+                # A client that hangs up or stalls only ends its own connection, never the loop
+                try:
+                    conn.settimeout(30.0)
+                    with conn, conn.makefile("rwb") as f:
+                        for line in f:
+                            try:
+                                request = json.loads(line)
+                                if request.get("backend", "torch") != queryer.backend:
+                                    raise ValueError(
+                                        f"Daemon serves the '{queryer.backend}' backend, "
+                                        f"not '{request.get('backend', 'torch')}'"
+                                    )
+                                results = queryer.query_components(
+                                    request["q"], request.get("k", 5), request.get("per_component", 1)
+                                )
+                                response = {"results": results}
+                            except Exception as e:
+                                response = {"error": str(e)}
+                            f.write(json.dumps(response).encode() + b"\n")
+                            f.flush()
+                except OSError as e:
+                    print(f"Client connection dropped: {e}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
 if __name__ == "__main__":
     app()
\ No newline at end of file